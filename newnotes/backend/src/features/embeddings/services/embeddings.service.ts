@@ -14,7 +14,8 @@ import { NoteEmbeddingRepository } from '../repositories/note-embedding.reposito
 export class EmbeddingsService {
   private readonly logger = new Logger(EmbeddingsService.name);
   private readonly embeddingsApiUrl: string;
-  private readonly defaultModel = 'all-MiniLM-L6-v2';
+  // Must match the embeddings service's EMBEDDINGS_MODEL_NAME
+  readonly defaultModel: string;
 
   constructor(
     private readonly httpService: HttpService,
@@ -24,6 +25,9 @@ export class EmbeddingsService {
     this.embeddingsApiUrl =
       this.configService.get<string>('EMBEDDINGS_API_URL') ||
       'http://embeddings-service:8001';
+    this.defaultModel =
+      this.configService.get<string>('EMBEDDINGS_MODEL_NAME') ||
+      'all-MiniLM-L6-v2';
   }
 
   async generateEmbedding(text: string): Promise<number[]> {
@@ -4,6 +4,7 @@ import { ScheduleModule } from '@nestjs/schedule';
 import { NoteRelationship } from './entities/note-relationship.entity';
 import { Note } from '@shared/entities/note.entity';
 import { NoteEmbedding } from '@features/embeddings/entities/note-embedding.entity';
+import { EmbeddingsModule } from '@features/embeddings/embeddings.module';
 import { RelationshipsService } from './services/relationships.service';
 import { SimilarityDetectionService } from './services/similarity-detection.service';
 import { WikiLinkParserService } from './services/wiki-link-parser.service';
@@ -15,6 +16,7 @@ import { NoteRelationshipListener } from './listeners/note-relationship.listener
   imports: [
     TypeOrmModule.forFeature([NoteRelationship, Note, NoteEmbedding]),
     ScheduleModule.forRoot(),
+    EmbeddingsModule,
   ],
   controllers: [RelationshipsController],
   providers: [
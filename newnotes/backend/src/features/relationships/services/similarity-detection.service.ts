@@ -4,6 +4,7 @@ import { InjectRepository } from '@nestjs/typeorm';
 import { Repository, DataSource } from 'typeorm';
 import { Note } from '@shared/entities/note.entity';
 import { NoteEmbedding } from '@features/embeddings/entities/note-embedding.entity';
+import { EmbeddingsService } from '@features/embeddings/services/embeddings.service';
 import { RelationshipsService } from './relationships.service';
 
 interface SimilarNote {
@@ -22,6 +23,7 @@ export class SimilarityDetectionService {
     private readonly embeddingsRepo: Repository<NoteEmbedding>,
     private readonly relationshipsService: RelationshipsService,
     private readonly dataSource: DataSource,
+    private readonly embeddingsService: EmbeddingsService,
   ) {}
 
   /**
@@ -98,11 +100,13 @@ export class SimilarityDetectionService {
         JOIN note_embeddings ne2 ON ne2."noteId" != ne1."noteId"
         JOIN notes n ON n.id = ne2."noteId"
         WHERE ne1."noteId" = $1
+          AND ne1.model = $4
+          AND ne2.model = $4
           AND 1 - (ne2.embedding <=> ne1.embedding) >= $2
         ORDER BY similarity DESC
         LIMIT $3
         `,
-        [noteId, minSimilarity, limit],
+        [noteId, minSimilarity, limit, this.embeddingsService.defaultModel],
       );
 
       return results.map((r) => ({
@@ -125,7 +129,7 @@ export class SimilarityDetectionService {
   ): Promise<void> {
     const metadata = {
       algorithm: 'cosine',
-      model: 'all-MiniLM-L6-v2',
+      model: this.embeddingsService.defaultModel,
       detectedAt: new Date().toISOString(),
     };
 
@@ -92,12 +92,12 @@ export class SearchService {
           n.updated_at as "updatedAt"
         FROM notes n
         JOIN note_embeddings ne ON n.id = ne."noteId"
-        WHERE ne.model = 'all-MiniLM-L6-v2'
+        WHERE ne.model = $4
           AND (1 - (ne.embedding <=> $1::vector)) >= $2
         ORDER BY ne.embedding <=> $1::vector
         LIMIT $3
       `,
-        [embeddingString, minScore, limit],
+        [embeddingString, minScore, limit, this.embeddingsService.defaultModel],
       );
 
       this.logger.log(`Found ${results.length} results`);
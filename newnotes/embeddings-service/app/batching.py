@@ -0,0 +1,127 @@
+"""
+Micro-batching of concurrent single-text embedding requests
+"""
+from concurrent.futures import Executor
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-text requests into batched encodes
+
+    Texts submitted while a batch is being collected (until max_batch texts are
+    queued or max_wait_ms has passed) are encoded in one call, and each caller
+    receives its own row of the result.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], np.ndarray],
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # The batch being collected or encoded, so stop() can fail its callers
+        self._inflight: List[Tuple[str, asyncio.Future]] = []
+
+    def start(self) -> None:
+        """Start the collector task on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the collector task, failing requests that are still queued or being encoded"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+        pending = self._inflight
+        self._inflight = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+
+        error = RuntimeError("Embedding batcher stopped")
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    async def submit(self, text: str) -> np.ndarray:
+        """
+        Queue a text for the next batch and wait for its embedding
+
+        Args:
+            text: Input text to embed
+
+        Returns:
+            Embedding vector for text
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self.start()
+
+        future = loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for a first item, then gather more until the batch is full or the wait expires"""
+        loop = asyncio.get_running_loop()
+        batch = self._inflight = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Callers that were cancelled while waiting don't need encoding
+        return [(text, future) for text, future in batch if not future.done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            try:
+                embeddings = await loop.run_in_executor(
+                    self.executor, self.encode_batch, [text for text, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Batched embedding generation failed: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._inflight = []
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+            self._inflight = []
@@ -0,0 +1,175 @@
+"""
+Caches for generated embeddings
+"""
+from cachetools import LRUCache
+import numpy as np
+from typing import Optional
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    """
+    Build the content-addressed cache key for a text
+
+    Args:
+        model_name: Model the embedding is generated with
+        text: Input text
+
+    Returns:
+        16 byte BLAKE2b digest of the model name and text
+    """
+    digest = hashlib.blake2b(model_name.encode(), digest_size=16)
+    digest.update(b"\0")
+    digest.update(text.encode())
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of embedding vectors, stored as raw float32 bytes"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._cache = LRUCache(maxsize=maxsize) if maxsize > 0 else None
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        """Return the cached embedding for key, or None on a miss"""
+        if self._cache is None:
+            return None
+        with self._lock:
+            data = self._cache.get(key)
+        if data is None:
+            return None
+        return np.frombuffer(data, dtype=np.float32)
+
+    def put(self, key: bytes, embedding) -> None:
+        """Store an embedding under key, evicting the least recently used entry if full"""
+        if self._cache is None:
+            return
+        data = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            self._cache[key] = data
+
+    def __len__(self) -> int:
+        if self._cache is None:
+            return 0
+        with self._lock:
+            return len(self._cache)
+
+
+class DiskEmbeddingCache:
+    """
+    Memory-mapped, content-addressed embedding cache shared across workers and restarts
+
+    The file is a fixed-size open-addressing hash table of (16 byte key, float16 vector)
+    slots. Readers probe without locking and re-check the slot key after copying the
+    vector, so a concurrent overwrite is seen as a miss. Writers are serialized with an
+    exclusive file lock and clear a slot's key before rewriting it.
+
+    The header records the layout and a fingerprint of the model and encode settings.
+    A file that doesn't match is replaced by a fresh one rather than rewritten in place,
+    so processes still mapping the old table are unaffected.
+    """
+
+    MAGIC = b"EMBCACHE"
+    VERSION = 2
+    HEADER = struct.Struct("<8sIIQ16s")
+    HEADER_SIZE = 64
+    MAX_PROBES = 8
+    EMPTY_KEY = bytes(16)
+
+    def __init__(self, path: str, dimension: int, slots: int = 65536, fingerprint: str = ""):
+        self.path = path
+        self.dimension = dimension
+        # Round up to a power of two so the home slot is a mask of the key
+        self.slots = 1 << max(0, slots - 1).bit_length()
+        self._mask = self.slots - 1
+        self._lock = threading.Lock()
+        self._header = self.HEADER.pack(
+            self.MAGIC, self.VERSION, self.dimension, self.slots, fingerprint.encode()[:16]
+        )
+        self._size = self.HEADER_SIZE + self.slots * (16 + 2 * self.dimension)
+
+        self._file = self._open()
+        self._table = np.memmap(
+            self._file,
+            dtype=np.dtype([("key", "V16"), ("vector", "<f2", (dimension,))]),
+            mode="r+",
+            offset=self.HEADER_SIZE,
+            shape=(self.slots,),
+        )
+
+    def _open(self):
+        """Open the table file, replacing it first if it was built with a different layout or model"""
+        while True:
+            file = open(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                # Another process may have replaced the file while we waited for the lock
+                current = os.fstat(file.fileno()).st_ino == os.stat(self.path).st_ino
+                if current and file.read(self.HEADER.size) == self._header and os.fstat(file.fileno()).st_size == self._size:
+                    return file
+                if current:
+                    self._replace()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+            file.close()
+
+    def _replace(self) -> None:
+        """Build an empty table in a temporary file and move it over the path"""
+        logger.info(f"Initializing embedding disk cache at {self.path} ({self.slots} slots)")
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as tmp:
+            tmp.write(self._header)
+            tmp.truncate(self._size)
+        os.replace(tmp_path, self.path)
+
+    def _probe(self, key: bytes):
+        home = int.from_bytes(key[:8], "little") & self._mask
+        for offset in range(self.MAX_PROBES):
+            yield (home + offset) & self._mask
+
+    def _slot_key(self, index: int) -> bytes:
+        return self._table["key"][index].tobytes()
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        """Return the cached embedding for key as float32, or None on a miss"""
+        for index in self._probe(key):
+            slot_key = self._slot_key(index)
+            if slot_key == self.EMPTY_KEY:
+                return None
+            if slot_key == key:
+                vector = self._table["vector"][index].astype(np.float32)
+                # The slot may have been overwritten while copying the vector
+                return vector if self._slot_key(index) == key else None
+        return None
+
+    def put(self, key: bytes, embedding) -> None:
+        """Store an embedding, replacing the home slot if the probe sequence is full"""
+        vector = np.asarray(embedding, dtype="<f2")
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                probes = list(self._probe(key))
+                index = next(
+                    (i for i in probes if self._slot_key(i) in (key, self.EMPTY_KEY)),
+                    probes[0],
+                )
+                self._table["key"][index] = np.void(self.EMPTY_KEY)
+                self._table["vector"][index] = vector
+                self._table["key"][index] = np.void(key)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Flush pending writes and release the mapping"""
+        self._table.flush()
+        del self._table
+        self._file.close()
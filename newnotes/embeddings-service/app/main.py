@@ -3,57 +3,158 @@ FastAPI Embeddings Service
 
 Provides REST API for generating text embeddings using Sentence Transformers
 """
-from fastapi import FastAPI, HTTPException
+from concurrent.futures import Future, ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional, Union
+import asyncio
+import base64
+import functools
+import itertools
 import logging
+import os
 
-from app.models import get_model
+import numpy as np
 
-# Configure logging
+from app.batching import MicroBatcher
+from app.cache import DiskEmbeddingCache, EmbeddingCache, embedding_key
+from app.models import INFERENCE_WORKERS, MODEL_NAME, EmbeddingModel, get_model
+
+# Configure logging (LOG_LEVEL=WARNING in production turns per-request logging into a level check)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+
+class SampledFilter(logging.Filter):
+    """Let one in every `rate` records through"""
+
+    def __init__(self, rate: int = 100):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return next(self._counter) % self.rate == 0
+
+
+# Per-request INFO logs are sampled so they stay cheap under load
+request_logger = logging.getLogger(f"{__name__}.requests")
+request_logger.addFilter(SampledFilter(rate=int(os.environ.get("LOG_SAMPLE_RATE", 100))))
+
+# Cache of recently generated embeddings, keyed on (model, text)
+embedding_cache = EmbeddingCache(maxsize=int(os.environ.get("EMBEDDINGS_CACHE_SIZE", 10_000)))
+
+# Optional on-disk cache shared by workers and across restarts (lazily opened)
+DISK_CACHE_PATH = os.environ.get("EMBEDDINGS_DISK_CACHE")
+DISK_CACHE_SLOTS = int(os.environ.get("EMBEDDINGS_DISK_CACHE_SLOTS", 65536))
+_disk_cache: Optional[DiskEmbeddingCache] = None
+
+# Single writer thread for the disk cache: its writes take a cross-process file lock,
+# which must never block the event loop
+disk_cache_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache")
+
+
+def get_disk_cache() -> Optional[DiskEmbeddingCache]:
+    """Get the disk cache, opening it sized for the model's dimension on first use"""
+    global _disk_cache
+    if _disk_cache is None and DISK_CACHE_PATH:
+        model = get_model()
+        _disk_cache = DiskEmbeddingCache(
+            DISK_CACHE_PATH,
+            dimension=model.get_dimension(),
+            slots=DISK_CACHE_SLOTS,
+            fingerprint=model.encoding_fingerprint(),
+        )
+    return _disk_cache
+
+
+async def _open_disk_cache() -> Optional[DiskEmbeddingCache]:
+    """Get the disk cache, opening it on the writer thread so file setup stays off the event loop"""
+    if _disk_cache is not None or not DISK_CACHE_PATH:
+        return _disk_cache
+    return await asyncio.get_running_loop().run_in_executor(disk_cache_writer, get_disk_cache)
+
+
+def _log_disk_cache_error(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error(f"Failed to write embedding to disk cache: {str(future.exception())}")
+
+
+# Embeddings currently being computed, so concurrent duplicate requests share one encode
+_pending_embeddings: Dict[bytes, asyncio.Future] = {}
+
+
+# Model inference runs here so it never blocks the event loop
+executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return get_model().generate_embeddings_batch(texts)
+
+
+# Coalesces concurrent single-text requests into one forward pass
+batcher = MicroBatcher(
+    _encode_batch,
+    max_batch=int(os.environ.get("EMBEDDINGS_MAX_BATCH", 64)),
+    max_wait_ms=float(os.environ.get("EMBEDDINGS_MAX_WAIT_MS", 5)),
+    executor=executor,
+)
+
 # Create FastAPI app
 app = FastAPI(
     title="Embeddings Service",
     description="Text embedding generation using Sentence Transformers",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes NumPy arrays natively, so embeddings skip the Python float round-trip
+    default_response_class=ORJSONResponse
 )
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # TODO: Configure for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# CORS is only needed for browser callers; internal services skip the middleware entirely
+if os.environ.get("ENABLE_CORS"):
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=os.environ.get("CORS_ORIGINS", "*").split(","),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 
 # Request/Response models
+EmbeddingFormat = Literal["json", "b64_fp16"]
+
+
 class EmbeddingRequest(BaseModel):
     text: str = Field(..., description="Text to generate embedding for", min_length=1)
-    model: str = Field(default="all-MiniLM-L6-v2", description="Model to use for embedding generation")
+    model: str = Field(default=MODEL_NAME, description="Model to use for embedding generation")
+    format: EmbeddingFormat = Field(
+        default="json",
+        description="Response encoding: JSON list of floats, or base64 of little-endian float16 values"
+    )
 
 
 class BatchEmbeddingRequest(BaseModel):
     texts: List[str] = Field(..., description="List of texts to generate embeddings for", min_items=1)
-    model: str = Field(default="all-MiniLM-L6-v2", description="Model to use for embedding generation")
+    model: str = Field(default=MODEL_NAME, description="Model to use for embedding generation")
+    format: EmbeddingFormat = Field(
+        default="json",
+        description="Response encoding: JSON lists of floats, or base64 of one row-major (count, dimension) float16 buffer"
+    )
 
 
 class EmbeddingResponse(BaseModel):
-    embedding: List[float] = Field(..., description="Generated embedding vector")
+    embedding: Union[List[float], str] = Field(..., description="Generated embedding vector")
     model: str = Field(..., description="Model used for generation")
     dimension: int = Field(..., description="Embedding dimension")
 
 
 class BatchEmbeddingResponse(BaseModel):
-    embeddings: List[List[float]] = Field(..., description="Generated embedding vectors")
+    embeddings: Union[List[List[float]], str] = Field(..., description="Generated embedding vectors")
     model: str = Field(..., description="Model used for generation")
     dimension: int = Field(..., description="Embedding dimension")
     count: int = Field(..., description="Number of embeddings generated")
@@ -66,6 +167,59 @@ class HealthResponse(BaseModel):
     dimension: int
 
 
+def _model_headers(model: EmbeddingModel) -> Dict[str, str]:
+    """Response headers describing the serving model, so callers can see its speed/quality trade-off"""
+    return {"X-Model-Family": model.family}
+
+
+def _format_embeddings(embeddings: np.ndarray, format: EmbeddingFormat) -> Union[np.ndarray, str]:
+    """Encode one embedding or a (count, dimension) matrix in the requested response format"""
+    if format == "b64_fp16":
+        return base64.b64encode(np.ascontiguousarray(embeddings, dtype="<f2").tobytes()).decode("ascii")
+    # orjson only serializes C-contiguous arrays
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def _forget_pending(key: bytes, future: asyncio.Future) -> None:
+    """Drop a finished computation, unless a newer one for the same key has replaced it"""
+    if _pending_embeddings.get(key) is future:
+        del _pending_embeddings[key]
+
+
+async def _get_or_compute_embedding(model: EmbeddingModel, text: str) -> np.ndarray:
+    """Return the cached embedding for text, computing and caching it on a miss"""
+    key = embedding_key(model.model_name, text)
+    embedding = embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+
+    disk_cache = await _open_disk_cache()
+    if disk_cache is not None:
+        embedding = disk_cache.get(key)
+        if embedding is not None:
+            embedding_cache.put(key, embedding)
+            return embedding
+
+    pending = _pending_embeddings.get(key)
+    if pending is None or pending.done():
+        pending = asyncio.ensure_future(_compute_and_cache(key, text))
+        _pending_embeddings[key] = pending
+        pending.add_done_callback(functools.partial(_forget_pending, key))
+
+    # Shielded so a disconnecting client doesn't cancel the encode other requests wait on
+    return await asyncio.shield(pending)
+
+
+async def _compute_and_cache(key: bytes, text: str) -> np.ndarray:
+    embedding = await batcher.submit(text)
+    embedding_cache.put(key, embedding)
+    disk_cache = await _open_disk_cache()
+    if disk_cache is not None:
+        # Fire-and-forget; the response doesn't wait for the write
+        disk_cache_writer.submit(disk_cache.put, key, embedding).add_done_callback(_log_disk_cache_error)
+    return embedding
+
+
 # API endpoints
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -95,7 +249,8 @@ async def generate_embedding(request: EmbeddingRequest):
         EmbeddingResponse with generated embedding
     """
     try:
-        logger.info(f"Generating embedding for text (length: {len(request.text)})")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Generating embedding for text (length: %d)", len(request.text))
 
         model = get_model()
 
@@ -106,16 +261,17 @@ async def generate_embedding(request: EmbeddingRequest):
                 detail=f"Model {request.model} not supported. Only {model.model_name} is available."
             )
 
-        # Generate embedding
-        embedding = model.generate_embedding(request.text)
+        # Generate embedding (served from cache for repeated texts)
+        embedding = await _get_or_compute_embedding(model, request.text)
 
-        logger.info(f"Successfully generated embedding (dimension: {len(embedding)})")
+        request_logger.info("Generated embedding (text length: %d, dimension: %d)", len(request.text), len(embedding))
 
-        return EmbeddingResponse(
-            embedding=embedding,
-            model=model.model_name,
-            dimension=model.get_dimension()
-        )
+        # Returned as a response directly so the array is not re-validated into Python floats
+        return ORJSONResponse({
+            "embedding": _format_embeddings(embedding, request.format),
+            "model": model.model_name,
+            "dimension": model.get_dimension()
+        }, headers=_model_headers(model))
 
     except HTTPException:
         raise
@@ -136,7 +292,8 @@ async def generate_embeddings_batch(request: BatchEmbeddingRequest):
         BatchEmbeddingResponse with generated embeddings
     """
     try:
-        logger.info(f"Generating embeddings for {len(request.texts)} texts")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Generating embeddings for %d texts", len(request.texts))
 
         model = get_model()
 
@@ -148,15 +305,65 @@ async def generate_embeddings_batch(request: BatchEmbeddingRequest):
             )
 
         # Generate embeddings
-        embeddings = model.generate_embeddings_batch(request.texts)
+        embeddings = await asyncio.get_running_loop().run_in_executor(
+            executor, model.generate_embeddings_batch, request.texts
+        )
 
-        logger.info(f"Successfully generated {len(embeddings)} embeddings")
+        request_logger.info("Generated %d embeddings", len(embeddings))
 
-        return BatchEmbeddingResponse(
-            embeddings=embeddings,
-            model=model.model_name,
-            dimension=model.get_dimension(),
-            count=len(embeddings)
+        # Returned as a response directly so the array is not re-validated into Python floats
+        return ORJSONResponse({
+            "embeddings": _format_embeddings(embeddings, request.format),
+            "model": model.model_name,
+            "dimension": model.get_dimension(),
+            "count": len(embeddings)
+        }, headers=_model_headers(model))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating embeddings: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate embeddings: {str(e)}")
+
+
+@app.post(
+    "/api/embeddings/generate/batch/raw",
+    response_class=Response,
+    responses={200: {"content": {"application/octet-stream": {}}}},
+)
+async def generate_embeddings_batch_raw(request: BatchEmbeddingRequest):
+    """
+    Generate embeddings for multiple texts as a raw float32 matrix
+
+    For internal callers that can read binary: the body is the row-major
+    (count, dimension) little-endian float32 buffer, with its shape in the
+    X-Shape header as "count,dimension".
+
+    Args:
+        request: BatchEmbeddingRequest with texts and model
+
+    Returns:
+        application/octet-stream response with the embedding matrix
+    """
+    try:
+        model = get_model()
+
+        # Validate model name
+        if request.model != model.model_name:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Model {request.model} not supported. Only {model.model_name} is available."
+            )
+
+        embeddings = await asyncio.get_running_loop().run_in_executor(
+            executor, model.generate_embeddings_batch, request.texts
+        )
+        count, dimension = embeddings.shape
+
+        return Response(
+            content=embeddings.astype("<f4", copy=False).tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Shape": f"{count},{dimension}", "X-Dtype": "float32", **_model_headers(model)}
         )
 
     except HTTPException:
@@ -173,12 +380,35 @@ async def startup_event():
     try:
         model = get_model()
         logger.info(f"Model loaded: {model.model_name} on {model.device}")
+        # On the inference thread: compiled CUDA graphs are recorded per thread, and the
+        # compilation stays off the event loop
+        await asyncio.get_running_loop().run_in_executor(executor, model.warmup)
         logger.info(f"Embedding dimension: {model.get_dimension()}")
+        batcher.start()
     except Exception as e:
         logger.error(f"Failed to load model on startup: {str(e)}")
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers on shutdown"""
+    global _disk_cache
+    await batcher.stop()
+    get_model().close()
+    if _disk_cache is not None:
+        # Runs after any queued writes on the writer thread
+        await asyncio.get_running_loop().run_in_executor(disk_cache_writer, _disk_cache.close)
+        _disk_cache = None
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8001,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WORKERS", 1)),
+    )
@@ -1,26 +1,549 @@
 """
 Sentence Transformers wrapper for embedding generation
 """
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import os
+
+
+def _cgroup_cpu_quota(cgroup_root: str = "/sys/fs/cgroup") -> Optional[float]:
+    """Read the container CPU quota (in CPUs) from cgroup v2 or v1, or None if unlimited"""
+    try:
+        with open(os.path.join(cgroup_root, "cpu.max")) as f:
+            quota, period = f.read().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us")) as f:
+            quota = int(f.read())
+        with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us")) as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process can use, honoring CPU affinity and container quotas"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return cpus
+
+
+# Threads running encodes side by side; each gets its own intra-op thread pool, so the
+# CPUs are split between them rather than every encode claiming all of them
+INFERENCE_WORKERS = max(1, int(os.environ.get("EMBEDDINGS_INFERENCE_WORKERS", 1)))
+
+# OpenMP/MKL size their thread pools when first loaded, so this must run before torch is imported
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, available_cpus() // INFERENCE_WORKERS)))
+os.environ.setdefault("MKL_NUM_THREADS", os.environ["OMP_NUM_THREADS"])
+
 from sentence_transformers import SentenceTransformer
+from sentence_transformers.models import Normalize, Pooling, Transformer
+import numpy as np
 import torch
-from typing import List
+import contextlib
+import hashlib
 import logging
+import tempfile
+import threading
 
 logger = logging.getLogger(__name__)
 
 
+class ModelInfo(NamedTuple):
+    dimension: int
+    family: str
+
+
+# Models vetted for this service; all produce 384-dim vectors to match the note_embeddings column
+SUPPORTED_MODELS = {
+    "all-MiniLM-L6-v2": ModelInfo(dimension=384, family="minilm-l6"),
+    "all-MiniLM-L12-v2": ModelInfo(dimension=384, family="minilm-l12"),
+    "paraphrase-MiniLM-L3-v2": ModelInfo(dimension=384, family="minilm-l3"),
+}
+MODEL_NAME = os.environ.get("EMBEDDINGS_MODEL_NAME", "all-MiniLM-L6-v2")
+
+torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+try:
+    torch.set_num_interop_threads(2)
+except RuntimeError:
+    # Can only be set once, before any inter-op parallel work has started
+    pass
+
+# The service never trains; this keeps model loading from recording autograd state
+torch.set_grad_enabled(False)
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+BATCH_SIZE = int(os.environ.get("EMBEDDINGS_BATCH_SIZE", 32))
+
+# Optional lower cap on input tokens; unset keeps the model's own limit
+MAX_SEQ_LENGTH = int(os.environ["EMBEDDINGS_MAX_SEQ"]) if os.environ.get("EMBEDDINGS_MAX_SEQ") else None
+
+# Inference backend: "torch" runs the SentenceTransformer eagerly, "onnx" exports
+# the transformer once and serves it through ONNX Runtime's optimized graph
+BACKEND = os.environ.get("EMBEDDINGS_BACKEND", "torch")
+ONNX_DIR = os.environ.get("EMBEDDINGS_ONNX_DIR", os.path.join(tempfile.gettempdir(), "embeddings-onnx"))
+ONNX_OPSET = 14
+
+# Set to "int8" to quantize the transformer's Linear layers (dynamic, per-row scales)
+QUANTIZE = os.environ.get("EMBEDDINGS_QUANTIZE", "")
+
+# Set to "1" to run the encoder GEMMs in FP8 through Transformer Engine (Hopper or newer)
+FP8 = os.environ.get("EMBEDDINGS_FP8", "") == "1"
+
+# Set to "1" to compile the transformer with torch.compile (slower startup, faster inference)
+COMPILE = os.environ.get("EMBEDDINGS_COMPILE", "") == "1"
+WARMUP_BATCH_SIZES = (1, 8, 32, 128)
+
+# With compilation enabled, batches are padded up to these shapes so each bucket keeps
+# one specialized graph instead of recompiling for every (batch, sequence) shape.
+# Mini-batches never exceed BATCH_SIZE, so no bucket is larger than it
+BATCH_BUCKETS = tuple(sorted({size for size in WARMUP_BATCH_SIZES if size < BATCH_SIZE} | {BATCH_SIZE}))
+SEQ_BUCKETS = (32, 64, 128, 256)
+
+# Batches at least this large are sharded across GPUs when more than one is visible
+MULTI_GPU_MIN_BATCH = 32
+
+
+class _OnnxExportWrapper(torch.nn.Module):
+    """Expose the HF transformer with positional inputs and a single output for export"""
+
+    def __init__(self, transformer: torch.nn.Module, input_names: List[str]):
+        super().__init__()
+        self.transformer = transformer
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.transformer(**dict(zip(self.input_names, inputs)))[0]
+
+
 class EmbeddingModel:
     """Wrapper for Sentence Transformers with GPU support"""
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        backend: str = BACKEND,
+        quantize: str = QUANTIZE,
+        fp8: bool = FP8,
+        compile: bool = COMPILE,
+    ):
         self.model_name = model_name
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = DEVICE
+        self.backend = backend
+        self.quantize = quantize
+
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unsupported embeddings backend: {backend}")
+        if quantize not in ("", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantize}")
+
+        info = SUPPORTED_MODELS.get(model_name)
+        self.family = info.family if info else "custom"
+        if info is None:
+            logger.warning(f"Model {model_name} is not in the vetted model list, dimension and quality are unchecked")
 
         logger.info(f"Loading model {model_name} on device {self.device}")
         self.model = SentenceTransformer(model_name, device=self.device)
-        logger.info(f"Model loaded successfully. Embedding dimension: {self.model.get_sentence_embedding_dimension()}")
+        # Frozen weights are never written to, so forked workers keep sharing their pages
+        self.model.requires_grad_(False)
+        # Taken before quantization or FP16 conversion rewrite the weights
+        self.revision = self._weights_digest()
+
+        if info is not None and self.get_dimension() != info.dimension:
+            raise ValueError(
+                f"Model {model_name} produces {self.get_dimension()}-dim embeddings, expected {info.dimension}"
+            )
+
+        if MAX_SEQ_LENGTH is not None:
+            self.model.max_seq_length = min(MAX_SEQ_LENGTH, self.model.max_seq_length)
+        self._ensure_fast_tokenizer()
+        self.inline, self.normalize = self._inspect_pipeline()
+
+        if backend == "onnx" and not self.inline:
+            # The ONNX path reproduces only mean pooling; anything else would silently change the vectors
+            logger.warning("ONNX backend requires a mean-pooled model, falling back to the torch backend")
+            backend = self.backend = "torch"
+
+        self.session = None
+        if backend == "onnx":
+            path = self._export_onnx()
+            if quantize == "int8":
+                path = self._quantize_onnx(path)
+            self.session = self._create_onnx_session(path)
+        elif quantize == "int8":
+            self._quantize_torch()
+
+        if self.session is None and self.device == "cuda":
+            # FP16 weights halve memory and let the encoder GEMMs run on tensor cores
+            self.model.half()
+
+        self.fp8_recipe = None
+        if fp8 and self.session is None:
+            self._enable_fp8()
+
+        self.compiled = False
+        self._compiled = {}
+        self.seq_buckets = tuple(
+            sorted({seq for seq in SEQ_BUCKETS if seq < self.model.max_seq_length} | {self.model.max_seq_length})
+        )
+        if compile and self.session is None and self.fp8_recipe is None and self.inline:
+            # Lets cuDNN pick the fastest kernels per bucket shape, and keeps every bucket's graph cached
+            torch.backends.cudnn.benchmark = True
+            torch._dynamo.config.cache_size_limit = 64
+            self.compiled = True
+
+        # One worker process per visible GPU; compiled and FP8 modules can't be sent to workers
+        self.pool = None
+        if (
+            self.session is None
+            and not self.compiled
+            and self.fp8_recipe is None
+            and torch.cuda.device_count() > 1
+        ):
+            self.pool = self.model.start_multi_process_pool()
+
+        logger.info(f"Model loaded successfully ({backend} backend, {self.quantize or 'fp32'}). Embedding dimension: {self.model.get_sentence_embedding_dimension()}")
+
+    def _ensure_fast_tokenizer(self):
+        """Swap in the Rust-backed tokenizer if the model came with a slow Python one"""
+        if self.model.tokenizer.is_fast:
+            return
 
-    def generate_embedding(self, text: str) -> List[float]:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model.tokenizer.name_or_path, use_fast=True)
+        if tokenizer.is_fast:
+            self.model.tokenizer = tokenizer
+        else:
+            logger.warning("No fast tokenizer available for this model, install tokenizers>=0.13")
+
+    def _inspect_pipeline(self):
+        """
+        Check whether the model is Transformer -> mean Pooling [-> Normalize]
+
+        Returns:
+            (inline, normalize): whether the inline tensor path reproduces the pipeline,
+            and whether the pipeline L2-normalizes its output
+        """
+        modules = list(self.model)
+        inline = (
+            len(modules) in (2, 3)
+            and isinstance(modules[0], Transformer)
+            and isinstance(modules[1], Pooling)
+            and modules[1].get_pooling_mode_str() == "mean"
+            and (len(modules) == 2 or isinstance(modules[2], Normalize))
+        )
+        if not inline:
+            logger.warning("Model pipeline is not mean pooling, falling back to SentenceTransformer.encode")
+        return inline, inline and len(modules) == 3
+
+    def _export_onnx(self) -> str:
+        """
+        Export the underlying transformer to ONNX, reusing a previous export
+
+        Returns:
+            Path to the exported ONNX graph
+        """
+        path = os.path.join(ONNX_DIR, f"{self.model_name.replace('/', '__')}-{self._onnx_fingerprint()}.onnx")
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(ONNX_DIR, exist_ok=True)
+        input_names = list(self.model.tokenizer.model_input_names)
+        dummy = self.model.tokenizer(["onnx export"], return_tensors="pt").to(self.device)
+        wrapper = _OnnxExportWrapper(self.model[0].auto_model, input_names).eval()
+
+        logger.info(f"Exporting {self.model_name} to ONNX at {path}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                wrapper,
+                tuple(dummy[name] for name in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=ONNX_OPSET,
+            )
+        os.replace(tmp_path, path)
+        return path
+
+    def _weights_digest(self) -> str:
+        """Identify the loaded model by name, hub revision and weights (local models have no revision)"""
+        transformer = self.model[0].auto_model
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(self.model_name.encode())
+        digest.update(str(getattr(transformer.config, "_commit_hash", None)).encode())
+        for tensor in transformer.state_dict().values():
+            digest.update(tensor.cpu().numpy().tobytes())
+        return digest.hexdigest()
+
+    def _fingerprint(self, *settings) -> str:
+        """Hash of the model revision, the torch/transformers versions and the given settings"""
+        import transformers
+
+        digest = hashlib.blake2b(digest_size=8)
+        for part in (self.revision, torch.__version__, transformers.__version__, *settings):
+            digest.update(str(part).encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _onnx_fingerprint(self) -> str:
+        """Identify the model revision and toolchain an export depends on, so upgrades never reuse a stale graph"""
+        return self._fingerprint(ONNX_OPSET)
+
+    def encoding_fingerprint(self) -> str:
+        """
+        Identify the model and every setting that changes its vectors
+
+        Returns:
+            Hex digest that changes whenever cached embeddings would no longer match new ones
+        """
+        return self._fingerprint(
+            self.backend,
+            self.device,
+            self.quantize or "fp32",
+            self.fp8_recipe is not None,
+            self.model.max_seq_length,
+            self.inline,
+            self.normalize,
+            ONNX_OPSET if self.session is not None else None,
+        )
+
+    def _quantize_onnx(self, path: str) -> str:
+        """Quantize an exported ONNX graph to INT8 weights, reusing a previous run"""
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = f"{os.path.splitext(path)[0]}.int8.onnx"
+        if not os.path.exists(quantized_path):
+            logger.info(f"Quantizing ONNX graph to INT8 at {quantized_path}")
+            tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+            quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, quantized_path)
+        return quantized_path
+
+    def _quantize_torch(self):
+        """Swap the transformer's nn.Linear layers for dynamically quantized INT8 ones"""
+        if self.device != "cpu":
+            logger.warning("INT8 dynamic quantization is only supported on CPU, keeping FP32 weights")
+            self.quantize = ""
+            return
+
+        self.model[0].auto_model = torch.quantization.quantize_dynamic(
+            self.model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    def _enable_fp8(self):
+        """Replace the encoder's nn.Linear layers with Transformer Engine FP8-capable ones"""
+        if self.device != "cuda" or torch.cuda.get_device_capability()[0] < 9:
+            logger.warning("FP8 inference requires a Hopper or newer GPU, keeping the current precision")
+            return
+
+        import transformer_engine.pytorch as te
+        from transformer_engine.common.recipe import DelayedScaling, Format
+
+        for layer in self.model[0].auto_model.encoder.layer:
+            linears = [
+                (parent, name, child)
+                for parent in layer.modules()
+                for name, child in parent.named_children()
+                if isinstance(child, torch.nn.Linear)
+            ]
+            for parent, name, linear in linears:
+                te_linear = te.Linear(
+                    linear.in_features,
+                    linear.out_features,
+                    bias=linear.bias is not None,
+                    params_dtype=linear.weight.dtype,
+                )
+                with torch.no_grad():
+                    te_linear.weight.copy_(linear.weight)
+                    if linear.bias is not None:
+                        te_linear.bias.copy_(linear.bias)
+                setattr(parent, name, te_linear)
+
+        self.fp8_recipe = DelayedScaling(margin=0, fp8_format=Format.HYBRID)
+
+    def _create_onnx_session(self, path: str):
+        """Create an ONNX Runtime session with all graph optimizations enabled"""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = int(os.environ["OMP_NUM_THREADS"])
+
+        providers = ["CPUExecutionProvider"]
+        if self.device == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+
+        return ort.InferenceSession(path, options, providers=providers)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts into a C-contiguous (len(texts), dimension) float32 array"""
+        if not texts:
+            return np.empty((0, self.get_dimension()), dtype=np.float32)
+        if self.session is not None:
+            return self._encode_sorted(texts, self._encode_onnx)
+
+        if self.pool is not None and len(texts) >= MULTI_GPU_MIN_BATCH:
+            embeddings = self.model.encode_multi_process(texts, self.pool, batch_size=BATCH_SIZE)
+            return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        if self.inline or self.fp8_recipe is not None:
+            return self._encode_sorted(texts, self._encode_torch)
+
+        # SentenceTransformer.encode already sorts by length and batches internally
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                texts, batch_size=BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False
+            )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def _encode_sorted(self, texts: List[str], encode_batch: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Encode texts in length-sorted mini-batches and restore the input order
+
+        Grouping texts of similar length keeps the padding added to each batch small.
+
+        Args:
+            texts: Input texts to embed
+            encode_batch: Function encoding one mini-batch of texts
+
+        Returns:
+            Embeddings in the same order as texts
+        """
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), self.get_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), BATCH_SIZE):
+            batch = order[start:start + BATCH_SIZE]
+            embeddings[batch] = encode_batch([texts[i] for i in batch])
+        return embeddings
+
+    def _inference_context(self):
+        """Autograd-free context for a forward pass, with FP8 autocast when enabled"""
+        if self.fp8_recipe is None:
+            return torch.inference_mode()
+
+        import transformer_engine.pytorch as te
+
+        # Transformer Engine updates its FP8 scaling state in place, which inference tensors forbid
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.no_grad())
+        stack.enter_context(te.fp8_autocast(enabled=True, fp8_recipe=self.fp8_recipe))
+        return stack
+
+    def _bucket(self, batch: int, seq: int) -> Optional[Tuple[int, int]]:
+        """Smallest (batch, sequence) bucket that fits the inputs, or None if the batch is too large"""
+        batch_bucket = next((size for size in BATCH_BUCKETS if size >= batch), None)
+        seq_bucket = next((size for size in self.seq_buckets if size >= seq), None)
+        if batch_bucket is None or seq_bucket is None:
+            return None
+        return batch_bucket, seq_bucket
+
+    def _pad_to_bucket(self, features, bucket: Tuple[int, int]) -> Dict[str, torch.Tensor]:
+        """Pad tokenizer output up to a bucket shape; padded rows and tokens are fully masked"""
+        batch, seq = features["input_ids"].shape
+        padding = (0, bucket[1] - seq, 0, bucket[0] - batch)
+        return {
+            name: torch.nn.functional.pad(
+                tensor, padding, value=self.model.tokenizer.pad_token_id if name == "input_ids" else 0
+            )
+            for name, tensor in features.items()
+        }
+
+    def _compiled_transformer(self, bucket: Tuple[int, int]) -> Callable:
+        """Compiled transformer specialized for one bucket shape"""
+        transformer = self._compiled.get(bucket)
+        if transformer is None:
+            transformer = torch.compile(self.model[0].auto_model, mode="reduce-overhead", dynamic=False)
+            self._compiled[bucket] = transformer
+        return transformer
+
+    def _prepare_texts(self, texts: List[str]) -> List[str]:
+        """Apply the text normalization Transformer.tokenize does before tokenizing (strip, optional lowercasing)"""
+        texts = [text.strip() for text in texts]
+        if getattr(self.model[0], "do_lower_case", False):
+            texts = [text.lower() for text in texts]
+        return texts
+
+    def _to_device(self, features) -> Dict[str, torch.Tensor]:
+        """Move tokenizer output to the model device, through pinned memory on CUDA so the copy is DMA-driven"""
+        if self.device != "cuda":
+            return dict(features)
+        return {
+            name: tensor.pin_memory().to(self.device, non_blocking=True)
+            for name, tensor in features.items()
+        }
+
+    def _encode_torch(self, texts: List[str]) -> np.ndarray:
+        """Tokenize, run the transformer, then mean-pool and L2-normalize directly on the output tensor"""
+        features = self.model.tokenizer(
+            self._prepare_texts(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.model.max_seq_length,
+            # FP8 GEMMs need the token count to be a multiple of 8
+            pad_to_multiple_of=8 if self.fp8_recipe is not None else None,
+            return_tensors="pt",
+        )
+        return self._encode_features(features)
+
+    def _encode_features(self, features) -> np.ndarray:
+        """Embed tokenizer output, padding it to a compiled bucket shape when compilation is enabled"""
+        batch, seq = features["input_ids"].shape
+        transformer = self.model[0].auto_model
+        bucket = self._bucket(batch, seq) if self.compiled else None
+        if bucket is not None:
+            features = self._pad_to_bucket(features, bucket)
+            transformer = self._compiled_transformer(bucket)
+        features = self._to_device(features)
+
+        with self._inference_context():
+            if not self.inline:
+                return self.model(dict(features))["sentence_embedding"].float().cpu().numpy()
+
+            token_embeddings = transformer(**features, return_dict=False)[0]
+            mask = features["attention_mask"].unsqueeze(-1).float()
+            embeddings = (token_embeddings.float() * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            if self.normalize:
+                embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+            return embeddings[:batch].cpu().numpy()
+
+    def _encode_onnx(self, texts: List[str]) -> np.ndarray:
+        """Run the ONNX graph, then mean-pool (and L2-normalize) the token embeddings"""
+        features = self.model.tokenizer(
+            self._prepare_texts(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.model.max_seq_length,
+            return_tensors="np",
+        )
+        inputs = {
+            node.name: features[node.name].astype(np.int64)
+            for node in self.session.get_inputs()
+        }
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        mask = features["attention_mask"][..., np.newaxis].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+    def generate_embedding(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single text
 
@@ -28,12 +551,11 @@ class EmbeddingModel:
             text: Input text to embed
 
         Returns:
-            List of floats representing the embedding vector
+            float32 array of shape (dimension,) representing the embedding vector
         """
-        embedding = self.model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+        return self._encode([text])[0]
 
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
         """
         Generate embeddings for multiple texts
 
@@ -41,10 +563,34 @@ class EmbeddingModel:
             texts: List of input texts to embed
 
         Returns:
-            List of embedding vectors
+            C-contiguous float32 array of shape (len(texts), dimension), one row per text
         """
-        embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-        return [emb.tolist() for emb in embeddings]
+        return self._encode(texts)
+
+    def warmup(self, batch_sizes=None):
+        """Encode dummy batches so the first real requests don't pay compilation or allocation cost"""
+        if not self.compiled:
+            for batch_size in batch_sizes or WARMUP_BATCH_SIZES:
+                self._encode(["warmup"] * batch_size)
+            return
+
+        # Compile every (batch, sequence) bucket that mini-batches can hit
+        for batch_size in batch_sizes or BATCH_BUCKETS:
+            for seq in self.seq_buckets:
+                features = self.model.tokenizer(
+                    ["warmup"] * batch_size,
+                    padding="max_length",
+                    truncation=True,
+                    max_length=seq,
+                    return_tensors="pt",
+                )
+                self._encode_features(features)
+
+    def close(self):
+        """Stop the multi-GPU worker processes, if any"""
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
 
     def get_dimension(self) -> int:
         """Get the embedding dimension"""
@@ -53,11 +599,19 @@ class EmbeddingModel:
 
 # Global model instance (lazy loaded)
 _model_instance = None
+_model_lock = threading.Lock()
 
 
 def get_model() -> EmbeddingModel:
     """Get or create the global model instance"""
     global _model_instance
     if _model_instance is None:
-        _model_instance = EmbeddingModel()
+        with _model_lock:
+            if _model_instance is None:
+                _model_instance = EmbeddingModel()
     return _model_instance
+
+
+def preload_model() -> EmbeddingModel:
+    """Load the global model before workers fork, so they share its memory copy-on-write"""
+    return get_model()
@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for running the embeddings service with several workers
+
+    gunicorn -c gunicorn.conf.py app.main:app
+"""
+import gc
+import os
+import shutil
+import subprocess
+
+# Let torch answer torch.cuda.is_available() through NVML, which does not initialize
+# CUDA, so importing the app in the master cannot poison forked workers
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+
+
+def _gpu_present() -> bool:
+    """Detect an NVIDIA GPU without going through torch/CUDA"""
+    if shutil.which("nvidia-smi") is None:
+        return False
+    try:
+        result = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0 and "GPU" in result.stdout
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8001)}"
+workers = int(os.environ.get("WORKERS", 1))
+# Picks uvloop and httptools automatically (both installed via uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+
+# On CPU, import the app in the master so the model is loaded once and shared copy-on-write.
+# CUDA cannot be initialized before fork, so on GPU hosts each worker imports the app and
+# loads its own model instead
+preload_app = not _gpu_present()
+
+
+def on_starting(server):
+    if not preload_app:
+        server.log.info("GPU detected, workers load their own model")
+        return
+
+    from app.models import preload_model
+
+    model = preload_model()
+    server.log.info(f"Preloaded model {model.model_name} for workers")
+
+    # Keep the garbage collector from touching (and so copying) preloaded objects in workers
+    gc.freeze()
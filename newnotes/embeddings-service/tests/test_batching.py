@@ -0,0 +1,101 @@
+"""
+Tests for micro-batching of single-text requests
+"""
+import asyncio
+import threading
+import numpy as np
+from app.batching import MicroBatcher
+
+
+def fake_encode_batch(calls):
+    def encode_batch(texts):
+        calls.append(list(texts))
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+    return encode_batch
+
+
+def test_concurrent_requests_are_coalesced():
+    """Test concurrent submissions are encoded in a single batch"""
+    calls = []
+    batcher = MicroBatcher(fake_encode_batch(calls), max_batch=64, max_wait_ms=50)
+    texts = ["a" * i for i in range(1, 11)]
+
+    async def run():
+        results = await asyncio.gather(*(batcher.submit(text) for text in texts))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert calls == [texts]
+    assert [result[0] for result in results] == [float(len(text)) for text in texts]
+
+
+def test_batches_respect_max_batch():
+    """Test no batch exceeds max_batch texts"""
+    calls = []
+    batcher = MicroBatcher(fake_encode_batch(calls), max_batch=4, max_wait_ms=50)
+
+    async def run():
+        await asyncio.gather(*(batcher.submit(str(i)) for i in range(10)))
+        await batcher.stop()
+
+    asyncio.run(run())
+
+    assert [len(batch) for batch in calls] == [4, 4, 2]
+
+
+def test_encode_errors_reach_every_caller():
+    """Test a failed batch raises in each waiting request"""
+    def failing_encode_batch(texts):
+        raise RuntimeError("encoder failed")
+
+    batcher = MicroBatcher(failing_encode_batch, max_wait_ms=10)
+
+    async def run():
+        results = await asyncio.gather(
+            batcher.submit("first"), batcher.submit("second"), return_exceptions=True
+        )
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batcher_restarts_on_new_event_loop():
+    """Test the batcher keeps working when used from a different event loop"""
+    calls = []
+    batcher = MicroBatcher(fake_encode_batch(calls), max_wait_ms=1)
+
+    assert asyncio.run(batcher.submit("one"))[0] == 3.0
+    assert asyncio.run(batcher.submit("three"))[0] == 5.0
+    assert calls == [["one"], ["three"]]
+
+
+def test_stop_fails_pending_requests():
+    """Test stopping the batcher fails queued and in-flight requests instead of leaving them hanging"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_encode_batch(texts):
+        started.set()
+        release.wait(5)
+        return np.zeros((len(texts), 1), dtype=np.float32)
+
+    batcher = MicroBatcher(slow_encode_batch, max_batch=1, max_wait_ms=1)
+
+    async def run():
+        in_flight = asyncio.ensure_future(batcher.submit("encoding"))
+        queued = asyncio.ensure_future(batcher.submit("queued"))
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        await batcher.stop()
+        release.set()
+        return await asyncio.gather(in_flight, queued, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert len(results) == 2
+    assert all(isinstance(result, RuntimeError) for result in results)
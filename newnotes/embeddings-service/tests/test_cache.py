@@ -0,0 +1,144 @@
+"""
+Tests for embedding caches
+"""
+import numpy as np
+import pytest
+from app.cache import DiskEmbeddingCache, EmbeddingCache, embedding_key
+
+
+def test_embedding_key_is_deterministic():
+    """Test same model and text produce the same key"""
+    assert embedding_key("all-MiniLM-L6-v2", "hello") == embedding_key("all-MiniLM-L6-v2", "hello")
+    assert len(embedding_key("all-MiniLM-L6-v2", "hello")) == 16
+
+
+def test_embedding_key_includes_model():
+    """Test keys differ per model and per text"""
+    assert embedding_key("model-a", "hello") != embedding_key("model-b", "hello")
+    assert embedding_key("model-a", "hello") != embedding_key("model-a", "hello!")
+
+
+def test_cache_roundtrip():
+    """Test cached embeddings come back as float32 vectors"""
+    cache = EmbeddingCache(maxsize=10)
+    key = embedding_key("model", "text")
+    cache.put(key, [0.1, -0.2, 0.3])
+
+    cached = cache.get(key)
+    assert cached.dtype == np.float32
+    assert cached.tolist() == np.array([0.1, -0.2, 0.3], dtype=np.float32).tolist()
+
+
+def test_cache_miss():
+    """Test missing keys return None"""
+    cache = EmbeddingCache(maxsize=10)
+    assert cache.get(embedding_key("model", "unknown")) is None
+
+
+def test_cache_evicts_least_recently_used():
+    """Test the oldest unused entry is evicted when full"""
+    cache = EmbeddingCache(maxsize=2)
+    first, second, third = (embedding_key("model", text) for text in ("a", "b", "c"))
+    cache.put(first, [1.0])
+    cache.put(second, [2.0])
+    cache.get(first)
+    cache.put(third, [3.0])
+
+    assert len(cache) == 2
+    assert cache.get(first) is not None
+    assert cache.get(second) is None
+    assert cache.get(third) is not None
+
+
+def test_cache_disabled():
+    """Test a zero-size cache never stores anything"""
+    cache = EmbeddingCache(maxsize=0)
+    key = embedding_key("model", "text")
+    cache.put(key, [1.0])
+
+    assert cache.get(key) is None
+    assert len(cache) == 0
+
+
+def test_disk_cache_roundtrip(tmp_path):
+    """Test disk-cached embeddings come back as float32 at float16 precision"""
+    cache = DiskEmbeddingCache(str(tmp_path / "embeddings.cache"), dimension=4, slots=16)
+    key = embedding_key("model", "text")
+    cache.put(key, [0.1, -0.2, 0.3, 0.4])
+
+    cached = cache.get(key)
+    assert cached.dtype == np.float32
+    assert cached == pytest.approx([0.1, -0.2, 0.3, 0.4], abs=1e-3)
+    assert cache.get(embedding_key("model", "other")) is None
+
+
+def test_disk_cache_persists_across_instances(tmp_path):
+    """Test entries written by one process are visible after reopening"""
+    path = str(tmp_path / "embeddings.cache")
+    key = embedding_key("model", "text")
+    writer = DiskEmbeddingCache(path, dimension=4, slots=16)
+    writer.put(key, [1.0, 2.0, 3.0, 4.0])
+    writer.close()
+
+    reader = DiskEmbeddingCache(path, dimension=4, slots=16)
+    assert reader.get(key).tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_disk_cache_resets_on_layout_change(tmp_path):
+    """Test a cache file built for another dimension is reinitialized"""
+    path = str(tmp_path / "embeddings.cache")
+    key = embedding_key("model", "text")
+    old = DiskEmbeddingCache(path, dimension=4, slots=16)
+    old.put(key, [1.0, 2.0, 3.0, 4.0])
+    old.close()
+
+    new = DiskEmbeddingCache(path, dimension=8, slots=16)
+    assert new.get(key) is None
+
+
+def test_disk_cache_resets_on_fingerprint_change(tmp_path):
+    """Test a cache file built with other model or encode settings is not served"""
+    path = str(tmp_path / "embeddings.cache")
+    key = embedding_key("model", "text")
+    old = DiskEmbeddingCache(path, dimension=4, slots=16, fingerprint="int8")
+    old.put(key, [1.0, 2.0, 3.0, 4.0])
+    old.close()
+
+    assert DiskEmbeddingCache(path, dimension=4, slots=16, fingerprint="int8").get(key) is not None
+    assert DiskEmbeddingCache(path, dimension=4, slots=16, fingerprint="fp32").get(key) is None
+
+
+def test_disk_cache_reset_leaves_existing_mappings_intact(tmp_path):
+    """Test replacing the file on a mismatch doesn't pull pages out from under open caches"""
+    path = str(tmp_path / "embeddings.cache")
+    key = embedding_key("model", "text")
+    old = DiskEmbeddingCache(path, dimension=4, slots=16)
+    old.put(key, [1.0, 2.0, 3.0, 4.0])
+
+    new = DiskEmbeddingCache(path, dimension=8, slots=16)
+    assert new.get(key) is None
+    np.testing.assert_allclose(old.get(key), [1.0, 2.0, 3.0, 4.0])
+    old.close()
+    new.close()
+
+
+def test_disk_cache_handles_collisions(tmp_path):
+    """Test keys sharing a home slot are stored in neighbouring slots"""
+    cache = DiskEmbeddingCache(str(tmp_path / "embeddings.cache"), dimension=2, slots=16)
+    keys = [bytes([0] * 8 + [i] * 8) for i in range(1, 4)]
+    for i, key in enumerate(keys):
+        cache.put(key, [float(i), float(i)])
+
+    for i, key in enumerate(keys):
+        assert cache.get(key).tolist() == [float(i), float(i)]
+
+
+def test_disk_cache_overwrites_when_probes_exhausted(tmp_path):
+    """Test a full probe sequence evicts the home slot instead of failing"""
+    cache = DiskEmbeddingCache(str(tmp_path / "embeddings.cache"), dimension=2, slots=16)
+    keys = [bytes([0] * 8 + [i] * 8) for i in range(1, DiskEmbeddingCache.MAX_PROBES + 2)]
+    for i, key in enumerate(keys):
+        cache.put(key, [float(i), float(i)])
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[-1]).tolist() == [float(len(keys) - 1)] * 2
@@ -0,0 +1,49 @@
+"""
+Tests for the gunicorn configuration
+"""
+import os
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loads the config like the gunicorn master does, runs its startup hook, and reports CUDA state
+MASTER_SCRIPT = """
+import importlib.util, sys, types
+
+spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(conf)
+conf.preload_app = sys.argv[1] == "1"
+
+server = types.SimpleNamespace(log=types.SimpleNamespace(info=lambda message: None))
+conf.on_starting(server)
+
+torch = sys.modules.get("torch")
+print(int(torch is not None and torch.cuda.is_initialized()), int("app.models" in sys.modules))
+"""
+
+
+def _run_master(preload: bool):
+    env = {key: value for key, value in os.environ.items() if key != "PYTORCH_NVML_BASED_CUDA_CHECK"}
+    result = subprocess.run(
+        [sys.executable, "-c", MASTER_SCRIPT, "1" if preload else "0"],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    cuda_initialized, app_imported = result.stdout.split()[-2:]
+    return cuda_initialized == "1", app_imported == "1"
+
+
+def test_master_without_preload_does_not_import_app():
+    """Test the master never imports the app (and so torch) when preloading is disabled"""
+    cuda_initialized, app_imported = _run_master(preload=False)
+    assert not cuda_initialized
+    assert not app_imported
+
+
+def test_preload_does_not_initialize_cuda():
+    """Test preloading the model in the master leaves CUDA uninitialized for forked workers"""
+    cuda_initialized, app_imported = _run_master(preload=True)
+    assert app_imported
+    assert not cuda_initialized
@@ -1,9 +1,18 @@
 """
 Tests for FastAPI embeddings service
 """
+import asyncio
+import base64
+import logging
+import threading
+
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+from app import main
+from app.cache import DiskEmbeddingCache, EmbeddingCache
 from app.main import app
+from app.models import SUPPORTED_MODELS, get_model
 
 client = TestClient(app)
 
@@ -17,7 +26,17 @@ def test_health_check():
     assert "model" in data
     assert "device" in data
     assert "dimension" in data
-    assert data["dimension"] == 384  # all-MiniLM-L6-v2 dimension
+    if data["model"] in SUPPORTED_MODELS:
+        assert data["dimension"] == SUPPORTED_MODELS[data["model"]].dimension
+    else:
+        assert data["dimension"] > 0
+
+
+def test_cors_disabled_by_default():
+    """Test CORS headers are only added when ENABLE_CORS is set"""
+    response = client.get("/health", headers={"Origin": "https://example.com"})
+    assert response.status_code == 200
+    assert "access-control-allow-origin" not in response.headers
 
 
 def test_generate_embedding():
@@ -37,6 +56,19 @@ def test_generate_embedding():
     assert data["dimension"] == 384
 
 
+def test_generate_embedding_model_family_header():
+    """Test responses report the serving model family"""
+    model = client.get("/health").json()["model"]
+    request_data = {
+        "text": "Model family test sentence.",
+        "model": model
+    }
+    response = client.post("/api/embeddings/generate", json=request_data)
+    assert response.status_code == 200
+    info = SUPPORTED_MODELS.get(model)
+    assert response.headers["x-model-family"] == (info.family if info else "custom")
+
+
 def test_generate_embedding_empty_text():
     """Test embedding generation with empty text"""
     request_data = {
@@ -90,6 +122,77 @@ def test_generate_embeddings_batch_empty():
     assert response.status_code == 422  # Validation error
 
 
+def test_generate_embedding_b64_fp16():
+    """Test single embedding returned as base64 float16"""
+    request_data = {
+        "text": "Base64 test sentence.",
+        "model": "all-MiniLM-L6-v2"
+    }
+    json_embedding = client.post("/api/embeddings/generate", json=request_data).json()["embedding"]
+    response = client.post("/api/embeddings/generate", json={**request_data, "format": "b64_fp16"})
+    assert response.status_code == 200
+    data = response.json()
+
+    embedding = np.frombuffer(base64.b64decode(data["embedding"]), dtype="<f2")
+    assert embedding.shape == (data["dimension"],)
+    assert embedding.astype(np.float32) == pytest.approx(json_embedding, abs=1e-3)
+
+
+def test_generate_embedding_invalid_format():
+    """Test unknown response formats are rejected"""
+    request_data = {
+        "text": "Test sentence",
+        "model": "all-MiniLM-L6-v2",
+        "format": "xml"
+    }
+    response = client.post("/api/embeddings/generate", json=request_data)
+    assert response.status_code == 422
+
+
+def test_generate_embeddings_batch_b64_fp16():
+    """Test batch embeddings returned as one base64 float16 matrix"""
+    request_data = {
+        "texts": ["First test sentence.", "Second test sentence."],
+        "model": "all-MiniLM-L6-v2"
+    }
+    json_embeddings = client.post("/api/embeddings/generate/batch", json=request_data).json()["embeddings"]
+    response = client.post("/api/embeddings/generate/batch", json={**request_data, "format": "b64_fp16"})
+    assert response.status_code == 200
+    data = response.json()
+
+    embeddings = np.frombuffer(base64.b64decode(data["embeddings"]), dtype="<f2")
+    embeddings = embeddings.reshape(data["count"], data["dimension"])
+    assert embeddings.shape == (2, 384)
+    for expected, actual in zip(json_embeddings, embeddings):
+        assert actual.astype(np.float32) == pytest.approx(expected, abs=1e-3)
+
+
+def test_generate_embeddings_batch_raw():
+    """Test batch embeddings returned as a raw float32 matrix"""
+    request_data = {
+        "texts": ["First test sentence.", "Second test sentence."],
+        "model": "all-MiniLM-L6-v2"
+    }
+    json_embeddings = client.post("/api/embeddings/generate/batch", json=request_data).json()["embeddings"]
+    response = client.post("/api/embeddings/generate/batch/raw", json=request_data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["x-shape"] == "2,384"
+
+    embeddings = np.frombuffer(response.content, dtype="<f4").reshape(2, 384)
+    assert embeddings == pytest.approx(np.array(json_embeddings))
+
+
+def test_generate_embeddings_batch_raw_wrong_model():
+    """Test raw batch endpoint rejects unsupported models"""
+    request_data = {
+        "texts": ["Test sentence"],
+        "model": "unsupported-model"
+    }
+    response = client.post("/api/embeddings/generate/batch/raw", json=request_data)
+    assert response.status_code == 400
+
+
 def test_generate_embeddings_batch_large():
     """Test batch embedding with larger batch"""
     texts = [f"Test sentence number {i}" for i in range(100)]
@@ -124,3 +227,114 @@ def test_embedding_consistency():
 
     # Check embeddings are identical
     assert embedding1 == embedding2
+
+
+def test_generate_embedding_cached(monkeypatch):
+    """Test repeated text is served from cache without re-encoding"""
+    model = get_model()
+    calls = []
+    original = model.generate_embeddings_batch
+
+    def counting_generate_embeddings_batch(texts):
+        calls.append(list(texts))
+        return original(texts)
+
+    monkeypatch.setattr(model, "generate_embeddings_batch", counting_generate_embeddings_batch)
+    request_data = {
+        "text": "Cache test sentence",
+        "model": "all-MiniLM-L6-v2"
+    }
+
+    response1 = client.post("/api/embeddings/generate", json=request_data)
+    response2 = client.post("/api/embeddings/generate", json=request_data)
+
+    assert response1.status_code == 200
+    assert response2.status_code == 200
+    assert response1.json()["embedding"] == response2.json()["embedding"]
+    assert calls == [["Cache test sentence"]]
+
+
+def test_generate_embedding_disk_cache(tmp_path, monkeypatch):
+    """Test embeddings are written to and served from the disk cache"""
+    monkeypatch.setattr(main, "DISK_CACHE_PATH", str(tmp_path / "embeddings.cache"))
+    monkeypatch.setattr(main, "_disk_cache", None)
+    request_data = {
+        "text": "Disk cache test sentence",
+        "model": "all-MiniLM-L6-v2"
+    }
+
+    first = client.post("/api/embeddings/generate", json=request_data).json()["embedding"]
+    # Writes are queued on the writer thread; wait for them before reading back
+    main.disk_cache_writer.submit(lambda: None).result()
+    monkeypatch.setattr(main, "embedding_cache", EmbeddingCache(maxsize=10))
+    monkeypatch.setattr(get_model(), "generate_embeddings_batch", None)
+    second = client.post("/api/embeddings/generate", json=request_data).json()["embedding"]
+
+    assert second == pytest.approx(first, abs=1e-3)
+    main.get_disk_cache().close()
+
+
+def test_disk_cache_writes_off_event_loop(tmp_path, monkeypatch):
+    """Test disk cache writes run on the dedicated writer thread"""
+    monkeypatch.setattr(main, "DISK_CACHE_PATH", str(tmp_path / "embeddings.cache"))
+    monkeypatch.setattr(main, "_disk_cache", None)
+    monkeypatch.setattr(main, "embedding_cache", EmbeddingCache(maxsize=0))
+    writer_threads = []
+    monkeypatch.setattr(DiskEmbeddingCache, "put", lambda self, key, embedding: writer_threads.append(threading.current_thread().name))
+
+    response = client.post("/api/embeddings/generate", json={"text": "Written off the loop"})
+    assert response.status_code == 200
+    main.disk_cache_writer.submit(lambda: None).result()
+
+    assert len(writer_threads) == 1
+    assert writer_threads[0].startswith("disk-cache")
+    main.get_disk_cache().close()
+
+
+def test_finished_computation_keeps_newer_pending_entry():
+    """Test a finished computation's cleanup doesn't drop a newer one for the same key"""
+    loop = asyncio.new_event_loop()
+    try:
+        finished, newer = loop.create_future(), loop.create_future()
+        main._pending_embeddings[b"key"] = newer
+        main._forget_pending(b"key", finished)
+        assert main._pending_embeddings[b"key"] is newer
+
+        main._forget_pending(b"key", newer)
+        assert b"key" not in main._pending_embeddings
+    finally:
+        main._pending_embeddings.pop(b"key", None)
+        loop.close()
+
+
+def test_startup_warms_up_on_inference_thread(monkeypatch):
+    """Test warmup runs on the thread that serves inference, where compiled graphs are recorded"""
+    warmup_threads = []
+    monkeypatch.setattr(get_model(), "warmup", lambda: warmup_threads.append(threading.current_thread().name))
+
+    with TestClient(app):
+        pass
+
+    assert len(warmup_threads) == 1
+    assert warmup_threads[0].startswith("inference")
+
+
+def test_sampled_filter():
+    """Test the sampled filter lets one in every rate records through"""
+    sampled = main.SampledFilter(rate=10)
+    record = logging.LogRecord("test", logging.INFO, __file__, 0, "message", None, None)
+
+    passed = [sampled.filter(record) for _ in range(30)]
+    assert sum(passed) == 3
+    assert passed[0]
+
+
+def test_per_request_logs_are_sampled(caplog):
+    """Test successful requests log at INFO only through the sampled request logger"""
+    with caplog.at_level(logging.INFO, logger="app.main"):
+        for _ in range(5):
+            client.post("/api/embeddings/generate/batch", json={"texts": ["Sampled logging"]})
+
+    per_request = [record for record in caplog.records if record.name == "app.main.requests"]
+    assert len(per_request) <= 1
+    assert not [record for record in caplog.records if record.name == "app.main" and record.levelno == logging.INFO]
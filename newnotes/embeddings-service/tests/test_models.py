@@ -1,8 +1,15 @@
 """
 Tests for embedding model wrapper
 """
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+import numpy as np
 import pytest
-from app.models import EmbeddingModel, get_model
+import torch
+from app import models
+from app.models import EmbeddingModel, _cgroup_cpu_quota, available_cpus, get_model
 
 
 def test_model_initialization():
@@ -26,9 +33,9 @@ def test_generate_embedding():
     text = "This is a test sentence."
     embedding = model.generate_embedding(text)
 
-    assert isinstance(embedding, list)
-    assert len(embedding) == 384
-    assert all(isinstance(x, float) for x in embedding)
+    assert isinstance(embedding, np.ndarray)
+    assert embedding.shape == (384,)
+    assert embedding.dtype == np.float32
 
 
 def test_generate_embeddings_batch():
@@ -41,10 +48,9 @@ def test_generate_embeddings_batch():
     ]
     embeddings = model.generate_embeddings_batch(texts)
 
-    assert isinstance(embeddings, list)
-    assert len(embeddings) == 3
-    assert all(len(emb) == 384 for emb in embeddings)
-    assert all(isinstance(x, float) for emb in embeddings for x in emb)
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.shape == (3, 384)
+    assert embeddings.dtype == np.float32
 
 
 def test_get_model_singleton():
@@ -70,8 +76,8 @@ def test_empty_text():
     embedding = model.generate_embedding("")
 
     # Should still return an embedding (model handles empty text)
-    assert isinstance(embedding, list)
-    assert len(embedding) == 384
+    assert isinstance(embedding, np.ndarray)
+    assert embedding.shape == (384,)
 
 
 def test_batch_empty_list():
@@ -79,7 +85,7 @@ def test_batch_empty_list():
     model = EmbeddingModel()
     embeddings = model.generate_embeddings_batch([])
 
-    assert isinstance(embeddings, list)
+    assert isinstance(embeddings, np.ndarray)
     assert len(embeddings) == 0
 
 
@@ -107,3 +113,317 @@ def test_embedding_semantic_similarity():
     # Similar sentences should have higher similarity
     assert sim_similar > sim_different
     assert sim_similar > 0.7  # Reasonable threshold for similar sentences
+
+
+def test_onnx_backend_matches_torch(tmp_path, monkeypatch):
+    """Test ONNX Runtime backend produces the same embeddings as PyTorch"""
+    pytest.importorskip("onnxruntime")
+    monkeypatch.setattr("app.models.ONNX_DIR", str(tmp_path))
+
+    texts = ["The cat sits on the mat.", "A much longer sentence that needs more tokens to encode."]
+    torch_embeddings = EmbeddingModel(backend="torch").generate_embeddings_batch(texts)
+    onnx_embeddings = EmbeddingModel(backend="onnx").generate_embeddings_batch(texts)
+
+    for expected, actual in zip(torch_embeddings, onnx_embeddings):
+        assert actual == pytest.approx(expected, abs=1e-4)
+
+
+def test_unsupported_backend():
+    """Test unknown backend names are rejected"""
+    with pytest.raises(ValueError):
+        EmbeddingModel(backend="tensorflow")
+
+
+def test_int8_quantization_close_to_fp32():
+    """Test INT8 quantized embeddings stay close to the FP32 ones"""
+    fp32_model = EmbeddingModel(quantize="")
+    int8_model = EmbeddingModel(quantize="int8")
+    if int8_model.quantize != "int8":
+        pytest.skip("INT8 dynamic quantization is CPU-only")
+
+    text = "Quantization should barely move the embedding."
+    fp32 = fp32_model.generate_embedding(text)
+    int8 = int8_model.generate_embedding(text)
+
+    cosine = fp32 @ int8 / (np.linalg.norm(fp32) * np.linalg.norm(int8))
+    assert cosine > 0.98
+
+
+def test_fp8_falls_back_without_hopper_gpu():
+    """Test FP8 is only enabled on Hopper or newer GPUs"""
+    if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 9:
+        pytest.skip("FP8 capable GPU present")
+
+    model = EmbeddingModel(fp8=True)
+    assert model.fp8_recipe is None
+    assert len(model.generate_embedding("FP8 fallback")) == 384
+
+
+def test_onnx_batch_preserves_input_order(tmp_path, monkeypatch):
+    """Test length-sorted mini-batching returns embeddings in input order"""
+    pytest.importorskip("onnxruntime")
+    monkeypatch.setattr("app.models.ONNX_DIR", str(tmp_path))
+    monkeypatch.setattr("app.models.BATCH_SIZE", 2)
+
+    model = EmbeddingModel(backend="onnx")
+    texts = ["A fairly long sentence about embeddings.", "Short.", "Medium length text.", "Tiny", "x"]
+    embeddings = model.generate_embeddings_batch(texts)
+
+    for text, embedding in zip(texts, embeddings):
+        assert embedding == pytest.approx(model.generate_embedding(text), abs=1e-5)
+
+
+def test_warmup():
+    """Test warmup encodes dummy batches without affecting results"""
+    model = EmbeddingModel()
+    before = model.generate_embedding("Warmup test sentence.")
+    model.warmup(batch_sizes=(1, 4))
+    after = model.generate_embedding("Warmup test sentence.")
+
+    assert after == pytest.approx(before, abs=1e-6)
+
+
+def test_available_cpus():
+    """Test usable CPU count is at least one and within the machine's CPUs"""
+    assert 1 <= available_cpus() <= os.cpu_count()
+
+
+def test_inference_threads_fit_available_cpus():
+    """Test concurrent inference workers don't oversubscribe the CPUs with intra-op threads"""
+    assert models.INFERENCE_WORKERS * torch.get_num_threads() <= max(available_cpus(), models.INFERENCE_WORKERS)
+
+
+def test_cgroup_v2_cpu_quota(tmp_path):
+    """Test cgroup v2 cpu.max is parsed into a CPU count"""
+    (tmp_path / "cpu.max").write_text("200000 100000\n")
+    assert _cgroup_cpu_quota(str(tmp_path)) == 2.0
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert _cgroup_cpu_quota(str(tmp_path)) is None
+
+
+def test_cgroup_v1_cpu_quota(tmp_path):
+    """Test cgroup v1 CFS quota and period are parsed into a CPU count"""
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("150000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert _cgroup_cpu_quota(str(tmp_path)) == 1.5
+
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    assert _cgroup_cpu_quota(str(tmp_path)) is None
+
+
+def test_cgroup_cpu_quota_missing(tmp_path):
+    """Test hosts without cgroup CPU limits report no quota"""
+    assert _cgroup_cpu_quota(str(tmp_path)) is None
+
+
+def test_multi_process_pool_only_with_multiple_gpus():
+    """Test batches are only sharded when several GPUs are visible"""
+    model = EmbeddingModel()
+    if torch.cuda.device_count() > 1:
+        assert model.pool is not None
+    else:
+        assert model.pool is None
+
+    embeddings = model.generate_embeddings_batch([f"Sentence {i}" for i in range(40)])
+    assert embeddings.shape == (40, 384)
+
+    model.close()
+    model.close()
+    assert model.pool is None
+
+
+def test_get_model_thread_safe(monkeypatch):
+    """Test concurrent first calls to get_model load the model only once"""
+    loads = []
+
+    class SlowModel:
+        def __init__(self):
+            loads.append(self)
+            time.sleep(0.05)
+
+    monkeypatch.setattr(models, "_model_instance", None)
+    monkeypatch.setattr(models, "EmbeddingModel", SlowModel)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: models.get_model(), range(8)))
+
+    assert len(loads) == 1
+    assert all(instance is loads[0] for instance in instances)
+    assert models.preload_model() is loads[0]
+
+
+def test_max_seq_length_and_fast_tokenizer():
+    """Test inputs are capped at the configured length with a fast tokenizer"""
+    model = EmbeddingModel()
+    assert model.model.max_seq_length == min(models.MAX_SEQ_LENGTH or 256, 256)
+    assert model.model.tokenizer.is_fast
+
+
+def test_max_seq_length_override(monkeypatch):
+    """Test EMBEDDINGS_MAX_SEQ lowers the model's sequence limit"""
+    monkeypatch.setattr("app.models.MAX_SEQ_LENGTH", 64)
+    assert EmbeddingModel().model.max_seq_length == 64
+
+
+def test_slow_tokenizer_is_replaced(monkeypatch):
+    """Test a slow tokenizer is swapped for the fast one"""
+    from transformers import AutoTokenizer
+
+    model = EmbeddingModel()
+    slow_tokenizer = AutoTokenizer.from_pretrained(model.model.tokenizer.name_or_path, use_fast=False)
+    model.model.tokenizer = slow_tokenizer
+    assert not model.model.tokenizer.is_fast
+
+    model._ensure_fast_tokenizer()
+    assert model.model.tokenizer.is_fast
+
+
+def test_supported_model_family():
+    """Test vetted models report their family"""
+    model = EmbeddingModel("all-MiniLM-L6-v2")
+    assert model.family == models.SUPPORTED_MODELS["all-MiniLM-L6-v2"].family
+
+
+def test_inline_path_matches_sentence_transformers():
+    """Test the inline tensor path reproduces SentenceTransformer.encode"""
+    model = EmbeddingModel()
+    assert model.inline
+    assert model.normalize
+
+    texts = ["The cat sits on the mat.", "A much longer sentence that needs more tokens to encode.", "x"]
+    expected = model.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    actual = model.generate_embeddings_batch(texts)
+
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+
+def test_non_mean_pooling_falls_back_to_encode():
+    """Test models the inline path can't reproduce still go through SentenceTransformer.encode"""
+    model = EmbeddingModel()
+    model.model[1].pooling_mode_mean_tokens = False
+    model.model[1].pooling_mode_cls_token = True
+    model.inline, model.normalize = model._inspect_pipeline()
+    assert not model.inline
+
+    text = "Pooled from the CLS token."
+    expected = model.model.encode([text], convert_to_numpy=True, show_progress_bar=False)[0]
+    assert model.generate_embedding(text) == pytest.approx(expected, abs=1e-6)
+
+
+def test_inputs_moved_to_model_device():
+    """Test tokenizer output is moved to the model device, pinned first on CUDA, without changing results"""
+    model = EmbeddingModel()
+    features = model._to_device(model.model.tokenizer(["Moved to the device."], return_tensors="pt"))
+    assert all(tensor.device.type == model.device for tensor in features.values())
+
+    text = "Copied through pinned memory."
+    expected = model.model.encode([text], convert_to_numpy=True, show_progress_bar=False)[0]
+    assert model.generate_embedding(text) == pytest.approx(expected, abs=1e-3)
+
+
+def test_compiled_batches_are_padded_to_buckets(monkeypatch):
+    """Test compiled inference pads to shape buckets and slices results back"""
+    compiled_shapes = []
+
+    def fake_compile(module, **kwargs):
+        def forward(**features):
+            compiled_shapes.append(tuple(features["input_ids"].shape))
+            return module(**features)
+        return forward
+
+    monkeypatch.setattr(torch, "compile", fake_compile)
+    model = EmbeddingModel(compile=True)
+    assert model.compiled
+    assert model.seq_buckets == tuple(size for size in (32, 64, 128, 256) if size <= model.model.max_seq_length)
+
+    texts = ["The cat sits on the mat.", "A much longer sentence that needs more tokens to encode.", "x"]
+    expected = model.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    actual = model.generate_embeddings_batch(texts)
+
+    seq = model.model.tokenizer(texts, padding=True, return_tensors="pt")["input_ids"].shape[1]
+    bucket = (8, min(size for size in model.seq_buckets if size >= seq))
+
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+    assert compiled_shapes == [bucket]
+    assert list(model._compiled) == [bucket]
+
+
+def test_warmup_compiles_every_bucket(monkeypatch):
+    """Test warmup builds one compiled graph per (batch, sequence) bucket"""
+    monkeypatch.setattr(torch, "compile", lambda module, **kwargs: module)
+    model = EmbeddingModel(compile=True)
+    model.warmup(batch_sizes=(1, 8))
+
+    assert set(model._compiled) == {(batch, seq) for batch in (1, 8) for seq in model.seq_buckets}
+
+
+def test_batch_buckets_capped_at_batch_size(monkeypatch):
+    """Test default warmup only compiles batch buckets mini-batches can reach"""
+    assert max(models.BATCH_BUCKETS) == models.BATCH_SIZE
+    monkeypatch.setattr(torch, "compile", lambda module, **kwargs: module)
+    model = EmbeddingModel(compile=True)
+    model.warmup()
+
+    assert {batch for batch, _ in model._compiled} == set(models.BATCH_BUCKETS)
+
+
+def test_onnx_backend_falls_back_for_non_mean_pooling(monkeypatch):
+    """Test the ONNX backend is refused for pipelines it can't reproduce"""
+    monkeypatch.setattr(EmbeddingModel, "_inspect_pipeline", lambda self: (False, False))
+
+    model = EmbeddingModel(backend="onnx")
+    assert model.backend == "torch"
+    assert model.session is None
+
+
+def test_onnx_export_path_tracks_toolchain_version(tmp_path, monkeypatch):
+    """Test an upgraded torch doesn't reuse a previous ONNX export"""
+    pytest.importorskip("onnxruntime")
+    monkeypatch.setattr("app.models.ONNX_DIR", str(tmp_path))
+    model = EmbeddingModel(backend="onnx")
+    before = model._onnx_fingerprint()
+
+    monkeypatch.setattr(torch, "__version__", "99.0.0")
+    assert model._onnx_fingerprint() != before
+
+
+def test_encoding_fingerprint_tracks_encode_settings(monkeypatch):
+    """Test settings that change the vectors change the fingerprint persistent caches are keyed on"""
+    model = EmbeddingModel()
+    assert model.encoding_fingerprint() == EmbeddingModel().encoding_fingerprint()
+
+    monkeypatch.setattr("app.models.MAX_SEQ_LENGTH", 64)
+    assert EmbeddingModel().encoding_fingerprint() != model.encoding_fingerprint()
+
+
+class RecordingTokenizer:
+    """Tokenizer proxy recording the texts it is asked to tokenize"""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.seen = []
+
+    def __call__(self, texts, *args, **kwargs):
+        self.seen.extend(texts)
+        return self.tokenizer(texts, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.tokenizer, name)
+
+
+def test_inline_path_applies_lowercasing(monkeypatch):
+    """Test the inline path strips and lowercases like SentenceTransformer.encode for do_lower_case models"""
+    model = EmbeddingModel()
+    monkeypatch.setattr(model.model[0], "do_lower_case", True)
+    tokenizer = RecordingTokenizer(model.model.tokenizer)
+    model.model[0].tokenizer = tokenizer
+
+    texts = ["  The Cat Sits On The MAT.  ", "MiXeD CaSe Input"]
+    expected = model.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    encode_seen, tokenizer.seen = tokenizer.seen, []
+    actual = model.generate_embeddings_batch(texts)
+
+    assert sorted(tokenizer.seen) == sorted(encode_seen) == sorted(text.strip().lower() for text in texts)
+    np.testing.assert_allclose(actual, expected, atol=1e-5)